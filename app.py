@@ -1,18 +1,66 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, session
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
-from shopping_agent import MemoryAwareAgent  # Import your existing code
+import threading
+import uuid
+from datetime import datetime
+from shopping_agent import SessionManager  # Import your existing code
+from llm_tiers import llm_usage
+from turn_recorder import TurnRecorder
+from rate_limiter import AdmissionController
+from intents import is_order_confirmation
 
 app = Flask(__name__)
+app.secret_key = os.getenv('SECRET_KEY')
+if not app.secret_key:
+    # Shopper ids live in the session cookie, so a per-process key orphans every history and cart on restart
+    print("WARNING: SECRET_KEY is not set. Using a random key; every restart or deploy will log all shoppers "
+          "out and start them on a new conversation and cart. Set SECRET_KEY in production.")
+    app.secret_key = os.urandom(24).hex()
 
-# Global agent instance (in production, you'd want per-user agents)
-agent = None
+# Behind a reverse proxy (Railway, nginx) the real client address is in X-Forwarded-For.
+# Only trust as many hops as there are proxies, otherwise clients can spoof their address.
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '0'))
+if os.getenv('TRUSTED_PROXY_COUNT') is None:
+    print("WARNING: TRUSTED_PROXY_COUNT is not set, so rate limits use the direct peer address. Behind a reverse "
+          "proxy every shopper then shares the proxy's address and one limit. Set it to the number of proxies "
+          "(1 on Railway), or to 0 if the app is exposed directly.")
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
 
-def get_agent():
-    global agent
-    if agent is None:
-        user_id = "web_user"  # Simple single user for now
-        agent = MemoryAwareAgent(user_id)
-    return agent
+# Per-user agents, kept resident within the memory budget and offloaded to disk when idle
+session_manager = SessionManager()
+
+# Rate limits per shopper, per client address and globally, plus the concurrent crew cap; checkout messages get priority
+admission = AdmissionController()
+
+# Set TURN_RECORD_DIR to capture sessions for offline replay with turn_recorder.py
+TURN_RECORD_DIR = os.getenv('TURN_RECORD_DIR')
+recorders = {}
+recorders_lock = threading.Lock()
+
+def get_recorder(user_id):
+    """One replay log per resident shopper session"""
+    with recorders_lock:
+        if user_id not in recorders:
+            os.makedirs(TURN_RECORD_DIR, exist_ok=True)
+            started = datetime.now().strftime('%Y%m%d%H%M%S%f')
+            path = os.path.join(TURN_RECORD_DIR, f"{user_id}_{started}.jsonl.gz")
+            recorders[user_id] = TurnRecorder(path, user_id)
+        return recorders[user_id]
+
+def drop_recorder(user_id):
+    """An offloaded session starts a fresh log, with a new snapshot, when it comes back"""
+    with recorders_lock:
+        recorders.pop(user_id, None)
+
+session_manager.offload_listeners.append(drop_recorder)
+
+def get_user_id():
+    """Each browser session gets its own shopper id"""
+    if 'user_id' not in session:
+        session['user_id'] = f"web_{uuid.uuid4().hex[:12]}"
+    return session['user_id']
 
 @app.route('/')
 def home():
@@ -25,31 +73,70 @@ def send_message():
     try:
         data = request.get_json()
         user_message = data.get('message', '').strip()
-        
+
         if not user_message:
             return jsonify({'error': 'Empty message'})
-        
+
         # This is where your input() function gets the text from
-        agent = get_agent()
-        response = agent.process_conversation(user_message)
-        
+        user_id = get_user_id()
+
+        # Reject early, before any agent is built or LLM quota spent.
+        # The address limit stops clients from resetting their allowance by dropping the session cookie.
+        # A bare "yes" is a checkout when the agent's last reply was the order summary asking for confirmation.
+        checkout = is_order_confirmation(user_message, session_manager.last_response(user_id))
+        ticket = admission.admit(user_id, request.remote_addr or 'unknown', user_message, checkout=checkout)
+        if not ticket['admitted']:
+            rejection = jsonify({
+                'error': ticket['error'],
+                'reason': ticket['reason'],
+                'success': False
+            })
+            return rejection, 429, {'Retry-After': str(ticket['retry_after'])}
+
+        try:
+            agent = session_manager.get_agent(user_id)
+            try:
+                if TURN_RECORD_DIR:
+                    response = get_recorder(user_id).process_conversation(agent, user_message)
+                else:
+                    response = agent.process_conversation(user_message)
+            finally:
+                session_manager.release(user_id)
+        finally:
+            admission.release(ticket)
+
         return jsonify({
             'response': response,
             'success': True
         })
-        
+
     except Exception as e:
         return jsonify({
             'error': str(e),
             'success': False
         })
 
+@app.route('/api/memory')
+def memory_stats():
+    """Resident memory usage per session and in total"""
+    return jsonify(session_manager.stats())
+
+@app.route('/api/rate_limits')
+def rate_limit_stats():
+    """Admission counters and current crew concurrency"""
+    return jsonify(admission.stats())
+
+@app.route('/api/llm_usage')
+def llm_usage_stats():
+    """Latency, token and cost accounting per agent role"""
+    return jsonify(llm_usage.stats())
+
 if __name__ == '__main__':
     # Check for OpenAI API key
     if not os.getenv('OPENAI_API_KEY'):
         print("Warning: OPENAI_API_KEY not found in environment variables")
         exit(1)
-    
+
     print("Starting web interface...")
     print("Open http://localhost:5000 in your browser")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
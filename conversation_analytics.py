@@ -0,0 +1,426 @@
+import argparse
+import glob
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from intents import INTENT_PATTERNS
+
+MEMORY_DIR = "convo_data"
+CART_DIR = "cart_data"
+EXPORT_DIR = "analytics_export"
+
+CONVERSATION_SUFFIX = "_conversation.json"
+CART_SUFFIX = "_cart.json"
+
+READ_CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 10_000
+# Distinct browse queries kept between trims; only the heaviest half survives each trim
+MAX_TRACKED_QUERIES = 50_000
+
+CONVERSATION_SCHEMA = pa.schema([
+    ("user_id", pa.string()),
+    ("turn_index", pa.int32()),
+    ("timestamp", pa.timestamp("us")),
+    ("user_input", pa.string()),
+    ("agent_response", pa.string()),
+    ("response_chars", pa.int32()),
+    ("intent", pa.string()),
+])
+
+CART_SCHEMA = pa.schema([
+    ("user_id", pa.string()),
+    ("cart_id", pa.string()),
+    ("variant_id", pa.string()),
+    ("product_name", pa.string()),
+    ("price", pa.float64()),
+    ("quantity", pa.int64()),
+    ("subtotal", pa.float64()),
+])
+
+
+def iter_json_array(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the elements of a top level JSON array one at a time without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+
+    with open(path, 'r') as f:
+        while True:
+            buffer = buffer.lstrip()
+
+            # Refill when the buffer can't hold a complete element yet
+            if not eof and len(buffer) < chunk_size:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    buffer += chunk
+                    continue
+                eof = True
+
+            if not started:
+                if not buffer.startswith("["):
+                    return  # empty or not an array
+                buffer = buffer[1:]
+                started = True
+                continue
+
+            if buffer.startswith(","):
+                buffer = buffer[1:]
+                continue
+            if not buffer or buffer.startswith("]"):
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    return  # truncated file, keep what we already yielded
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    eof = True
+                buffer += chunk
+                continue
+
+            yield element
+            buffer = buffer[end:]
+
+
+def user_id_from_path(path: str, suffix: str) -> str:
+    return os.path.basename(path)[:-len(suffix)]
+
+
+def iter_conversation_rows(memory_dir: str = MEMORY_DIR) -> Iterator[Dict[str, Any]]:
+    """Stream every conversation turn from all users' conversation stores"""
+    for path in sorted(glob.glob(os.path.join(memory_dir, f"*{CONVERSATION_SUFFIX}"))):
+        user_id = user_id_from_path(path, CONVERSATION_SUFFIX)
+        try:
+            for turn_index, conv in enumerate(iter_json_array(path)):
+                if not isinstance(conv, dict):
+                    continue
+                try:
+                    timestamp = datetime.fromisoformat(conv.get("timestamp", ""))
+                except (TypeError, ValueError):
+                    timestamp = None
+                yield {
+                    "user_id": user_id,
+                    "turn_index": turn_index,
+                    "timestamp": timestamp,
+                    "user_input": conv.get("user_input", ""),
+                    "agent_response": conv.get("agent_response", ""),
+                }
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Skipping {path}: {e}")
+
+
+def to_number(value) -> Optional[float]:
+    """Parse a cart amount; prices come from LLM supplied product_info and may be strings like '₹45'"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        try:
+            number = float(re.sub(r"[^\d.\-]", "", value))
+        except ValueError:
+            return None
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def iter_cart_rows(memory_dir: str = MEMORY_DIR, cart_dir: str = CART_DIR) -> Iterator[Dict[str, Any]]:
+    """Stream every cart line item from the CartManager and PersistentCartManager stores"""
+    paths = sorted(glob.glob(os.path.join(memory_dir, f"*{CART_SUFFIX}")))
+    for path in sorted(glob.glob(os.path.join(cart_dir, f"*{CART_SUFFIX}"))):
+        # convo_data holds the authoritative cart; cart_data is only a snapshot of it
+        if not os.path.exists(os.path.join(memory_dir, os.path.basename(path))):
+            paths.append(path)
+
+    for path in paths:
+        user_id = user_id_from_path(path, CART_SUFFIX)
+        try:
+            with open(path, 'r') as f:
+                cart = json.load(f)
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+
+        for item in cart.get("items", []):
+            if not isinstance(item, dict):
+                continue
+            price = to_number(item.get("price"))
+            quantity = to_number(item.get("quantity"))
+            if price is None or quantity is None or quantity != int(quantity):
+                print(f"Skipping cart item in {path}: price={item.get('price')!r} quantity={item.get('quantity')!r}")
+                continue
+            yield {
+                "user_id": user_id,
+                "cart_id": str(cart.get("cart_id", "")),
+                "variant_id": str(item.get("variant_id", "")),
+                "product_name": str(item.get("product_name", "")),
+                "price": price,
+                "quantity": int(quantity),
+                # A string price makes add_item repeat the string instead of multiplying, so recompute
+                "subtotal": round(price * quantity, 2),
+            }
+
+
+def has_conversation(memory_dir: str, user_id: str) -> bool:
+    """Whether iter_conversation_rows yields at least one turn for user_id"""
+    path = os.path.join(memory_dir, f"{user_id}{CONVERSATION_SUFFIX}")
+    if not os.path.exists(path):
+        return False
+    try:
+        return any(isinstance(conv, dict) for conv in iter_json_array(path))
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def load_catalog_names(path: str) -> List[str]:
+    """Product names from a saved fetch_catalog response, [{'data': [{'product_name': ...}]}]"""
+    with open(path, 'r') as f:
+        catalog = json.load(f)
+    names = []
+    for page in catalog if isinstance(catalog, list) else [catalog]:
+        for product in page.get("data", []) if isinstance(page, dict) else []:
+            if isinstance(product, dict) and product.get("product_name"):
+                names.append(product["product_name"])
+    return names
+
+
+def iter_record_batches(rows: Iterator[Dict[str, Any]], schema: pa.Schema,
+                        batch_size: int = BATCH_SIZE) -> Iterator[pa.RecordBatch]:
+    """Group row dicts into fixed size Arrow record batches"""
+    pending: List[Dict[str, Any]] = []
+    for row in rows:
+        pending.append(row)
+        if len(pending) >= batch_size:
+            yield pa.RecordBatch.from_pylist(pending, schema=schema)
+            pending = []
+    if pending:
+        yield pa.RecordBatch.from_pylist(pending, schema=schema)
+
+
+def classify_intents(user_inputs: pa.Array) -> pa.Array:
+    """Vectorized intent labelling of a column of user messages"""
+    intents = pa.nulls(len(user_inputs), pa.string())
+    for intent, pattern in INTENT_PATTERNS:
+        matched = pc.fill_null(pc.match_substring_regex(user_inputs, pattern, ignore_case=True), False)
+        intents = pc.if_else(pc.and_(matched, pc.is_null(intents)), intent, intents)
+    return pc.fill_null(intents, "other")
+
+
+def enrich_conversation_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Add the derived columns to a raw conversation batch"""
+    user_inputs = pc.fill_null(batch.column("user_input"), "")
+    responses = pc.fill_null(batch.column("agent_response"), "")
+    return pa.RecordBatch.from_arrays(
+        [
+            batch.column("user_id"),
+            batch.column("turn_index"),
+            batch.column("timestamp"),
+            user_inputs,
+            responses,
+            pc.cast(pc.utf8_length(responses), pa.int32()),
+            classify_intents(user_inputs),
+        ],
+        schema=CONVERSATION_SCHEMA,
+    )
+
+
+class BatchWriter:
+    """Writes record batches to either a Parquet file or an Arrow IPC file"""
+
+    def __init__(self, path: str, schema: pa.Schema, file_format: str = "parquet"):
+        self.path = path
+        self.file_format = file_format
+        if file_format == "parquet":
+            self.writer = pq.ParquetWriter(path, schema, compression="zstd")
+        elif file_format == "arrow":
+            self.sink = pa.OSFile(path, 'wb')
+            self.writer = ipc.new_file(self.sink, schema)
+        else:
+            raise ValueError(f"Unknown export format: {file_format}")
+
+    def write(self, batch: pa.RecordBatch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        if self.file_format == "arrow":
+            self.sink.close()
+
+
+class UserCounter:
+    """
+    Counts distinct users in a stream where each user's rows arrive contiguously,
+    which holds because the stores are read one file per user. Needs no per-user state.
+    Users rejected by include are not counted.
+    """
+
+    def __init__(self, include: Optional[Callable[[str], bool]] = None):
+        self.include = include
+        self.count = 0
+        self.last_user = None
+
+    def update(self, user_ids: pa.Array):
+        for user_id in pc.unique(user_ids).to_pylist():  # first-occurrence order
+            if user_id == self.last_user:
+                continue
+            self.last_user = user_id
+            if self.include is None or self.include(user_id):
+                self.count += 1
+
+
+class ConversationAnalytics:
+    """
+    Running aggregates over conversation and cart batches.
+    State is bounded by the catalog size and MAX_TRACKED_QUERIES, not by the number of turns or users.
+    Browse query counts are approximate once trimming kicks in.
+    """
+
+    def __init__(self, top_n: int = 20, product_names: Optional[List[str]] = None,
+                 has_conversation: Optional[Callable[[str], bool]] = None):
+        self.top_n = top_n
+        self.total_turns = 0
+        self.intent_counts = Counter()
+        self.query_counts = Counter()
+        self.product_names = set(product_names or [])
+        self.product_mentions = Counter()
+        self.carted_quantities = Counter()
+        self.users = UserCounter()
+        self.checkout_users = UserCounter()
+        # Only shoppers who also count towards total_users, so the rate stays within [0, 1]
+        self.open_cart_users = UserCounter(include=has_conversation)
+        self.response_chars = 0
+
+    def update_conversations(self, batch: pa.RecordBatch):
+        self.total_turns += batch.num_rows
+        self.response_chars += pc.sum(batch.column("response_chars")).as_py() or 0
+
+        for entry in pc.value_counts(batch.column("intent")).to_pylist():
+            self.intent_counts[entry["values"]] += entry["counts"]
+
+        self.users.update(batch.column("user_id"))
+
+        intents = batch.column("intent")
+        self.checkout_users.update(pc.filter(batch.column("user_id"), pc.equal(intents, "checkout")))
+
+        # Normalised browse queries tell us which lookups are worth caching or fast-pathing
+        normalised = pc.utf8_trim_whitespace(pc.utf8_lower(batch.column("user_input")))
+        browse_inputs = pc.filter(normalised, pc.equal(intents, "browse"))
+        for entry in pc.value_counts(browse_inputs).to_pylist():
+            self.query_counts[entry["values"]] += entry["counts"]
+        if len(self.query_counts) > MAX_TRACKED_QUERIES:
+            self.query_counts = Counter(dict(self.query_counts.most_common(MAX_TRACKED_QUERIES // 2)))
+
+        # Products shoppers ask for by name, whatever the intent
+        for name in self.product_names:
+            mentioned = pc.sum(pc.match_substring(normalised, name.lower())).as_py() or 0
+            if mentioned:
+                self.product_mentions[name] += mentioned
+
+    def update_carts(self, batch: pa.RecordBatch):
+        self.open_cart_users.update(batch.column("user_id"))
+
+        grouped = pa.Table.from_batches([batch]).group_by("product_name").aggregate([("quantity", "sum")])
+        for name, quantity in zip(grouped.column("product_name").to_pylist(),
+                                  grouped.column("quantity_sum").to_pylist()):
+            if name:
+                self.carted_quantities[name] += quantity or 0
+                self.product_names.add(name)
+
+    def report(self) -> Dict[str, Any]:
+        users = self.users.count
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "total_users": users,
+            "total_turns": self.total_turns,
+            "avg_response_chars": round(self.response_chars / self.total_turns, 1) if self.total_turns else 0.0,
+            "intent_mix": {
+                intent: round(count / self.total_turns, 4) if self.total_turns else 0.0
+                for intent, count in self.intent_counts.most_common()
+            },
+            "intent_counts": dict(self.intent_counts),
+            # Carts are cleared after a successful order, so this is not a conversion rate
+            "open_cart_rate": round(self.open_cart_users.count / users, 4) if users else 0.0,
+            "checkout_intent_rate": round(self.checkout_users.count / users, 4) if users else 0.0,
+            "top_searched_products": [
+                {"product_name": name, "mentions": mentions}
+                for name, mentions in self.product_mentions.most_common(self.top_n)
+            ],
+            "top_carted_products": [
+                {"product_name": name, "quantity": quantity}
+                for name, quantity in self.carted_quantities.most_common(self.top_n)
+            ],
+            "top_browse_queries": [
+                {"query": query, "count": count}
+                for query, count in self.query_counts.most_common(self.top_n)
+            ],
+        }
+
+
+def run_export(memory_dir: str = MEMORY_DIR, cart_dir: str = CART_DIR, output_dir: str = EXPORT_DIR,
+               file_format: str = "parquet", batch_size: int = BATCH_SIZE,
+               top_n: int = 20, catalog_path: Optional[str] = None) -> Dict[str, Any]:
+    """Stream all stores into columnar files and return the aggregate report"""
+    os.makedirs(output_dir, exist_ok=True)
+    extension = "parquet" if file_format == "parquet" else "arrow"
+    product_names = load_catalog_names(catalog_path) if catalog_path else []
+    analytics = ConversationAnalytics(top_n=top_n, product_names=product_names,
+                                      has_conversation=lambda user_id: has_conversation(memory_dir, user_id))
+
+    # Carts go first so their product names are known when counting mentions in conversations
+    writer = BatchWriter(os.path.join(output_dir, f"cart_items.{extension}"), CART_SCHEMA, file_format)
+    try:
+        for batch in iter_record_batches(iter_cart_rows(memory_dir, cart_dir), CART_SCHEMA, batch_size):
+            writer.write(batch)
+            analytics.update_carts(batch)
+    finally:
+        writer.close()
+
+    raw_schema = pa.schema([field for field in CONVERSATION_SCHEMA if field.name not in ("response_chars", "intent")])
+    writer = BatchWriter(os.path.join(output_dir, f"conversations.{extension}"), CONVERSATION_SCHEMA, file_format)
+    try:
+        for raw_batch in iter_record_batches(iter_conversation_rows(memory_dir), raw_schema, batch_size):
+            batch = enrich_conversation_batch(raw_batch)
+            writer.write(batch)
+            analytics.update_conversations(batch)
+    finally:
+        writer.close()
+
+    report = analytics.report()
+    with open(os.path.join(output_dir, "summary.json"), 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command line entry point for the export batch job"""
+    parser = argparse.ArgumentParser(description="Export conversation and cart history to columnar files")
+    parser.add_argument("--memory-dir", default=MEMORY_DIR)
+    parser.add_argument("--cart-dir", default=CART_DIR)
+    parser.add_argument("--output-dir", default=EXPORT_DIR)
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--catalog", help="Saved fetch_catalog response used to recognise product names")
+    args = parser.parse_args(argv)
+
+    report = run_export(args.memory_dir, args.cart_dir, args.output_dir,
+                        args.format, args.batch_size, args.top, args.catalog)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import re
+from typing import Optional
+
+# Keyword heuristics for what a shopper message is asking for. The patterns are plain strings so they
+# work both with Python's re and with the RE2 engine behind pyarrow.compute.
+CHECKOUT_PATTERN = r"\b(checkout|check out|place (my |the )?order|confirm (my |the )?order|buy now|pay)\b"
+CART_PATTERN = r"\b(cart|add|remove|update|change to|increase|another|more|i want \d+|give me|i'll take)\b"
+BROWSE_PATTERN = r"\b(catalog|catelog|categor|browse|show|what do you have|menu|list|products?|items?)\b"
+
+# Agent replies that end by asking the shopper to confirm the order, such as the order agent's
+# "Ready to place your order? (Type 'yes' to confirm)"
+CONFIRMATION_PROMPT_PATTERN = r"(ready to place|type '?yes'? to confirm|proceed to checkout|confirm (your|the) order|place (your|the) order\?)"
+# Short replies accepting such a prompt
+AFFIRMATIVE_PATTERN = r"^\W*(yes|yeah|yep|yup|y|ok|okay|sure|confirm(ed)?|go ahead|do it|place it)\b[\w\s,.!]{0,20}$"
+
+# Checked in order, first match wins
+INTENT_PATTERNS = [
+    ("checkout", CHECKOUT_PATTERN),
+    ("cart", CART_PATTERN),
+    ("browse", BROWSE_PATTERN),
+]
+
+_checkout_re = re.compile(CHECKOUT_PATTERN, re.IGNORECASE)
+_confirmation_prompt_re = re.compile(CONFIRMATION_PROMPT_PATTERN, re.IGNORECASE)
+_affirmative_re = re.compile(AFFIRMATIVE_PATTERN, re.IGNORECASE)
+
+
+def is_checkout_message(message: str) -> bool:
+    return bool(_checkout_re.search(message))
+
+
+def is_order_confirmation(message: str, previous_reply: Optional[str]) -> bool:
+    """A "yes" only means checkout when the agent's last reply asked to confirm the order"""
+    if not previous_reply or not _affirmative_re.search(message.strip()):
+        return False
+    return bool(_confirmation_prompt_re.search(previous_reply))
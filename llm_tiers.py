@@ -0,0 +1,204 @@
+import copy
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import litellm
+from crewai import LLM
+
+# Routing and catalog formatting run on a fast small model, order reconciliation on a stronger one
+MODEL_TIERS = {
+    'router': {
+        'model': os.getenv('ROUTER_MODEL', 'gpt-4o-mini'),
+        'fallback': os.getenv('ROUTER_FALLBACK_MODEL', 'gpt-4.1-nano'),
+    },
+    'browsing': {
+        'model': os.getenv('BROWSING_MODEL', 'gpt-4o-mini'),
+        'fallback': os.getenv('BROWSING_FALLBACK_MODEL', 'gpt-4.1-nano'),
+    },
+    'order': {
+        'model': os.getenv('ORDER_MODEL', 'gpt-4o'),
+        'fallback': os.getenv('ORDER_FALLBACK_MODEL', 'gpt-4o-mini'),
+    },
+}
+
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+# A primary call slower than this counts against the model just like an error
+LLM_SLOW_THRESHOLD = float(os.getenv('LLM_SLOW_THRESHOLD', '15'))
+# After this many consecutive slow or failed calls the primary is skipped for the cooldown
+LLM_FAILURE_THRESHOLD = int(os.getenv('LLM_FAILURE_THRESHOLD', '3'))
+LLM_COOLDOWN = float(os.getenv('LLM_COOLDOWN', '60'))
+
+# Settings CrewAI adjusts on the agent's LLM at run time (e.g. the executor's ReAct stop words),
+# mirrored onto the fallback before every call so its completions parse the same way
+SHARED_LLM_PARAMS = [
+    'stop', 'temperature', 'top_p', 'n', 'max_tokens', 'max_completion_tokens', 'presence_penalty',
+    'frequency_penalty', 'logit_bias', 'response_format', 'seed', 'logprobs', 'top_logprobs',
+    'reasoning_effort', 'stream', 'additional_params',
+]
+
+
+def count_tokens(model: str, payload) -> int:
+    """Token count for a prompt (str or message list) or completion, estimated if litellm can't tell"""
+    try:
+        if isinstance(payload, str):
+            return litellm.token_counter(model=model, text=payload)
+        return litellm.token_counter(model=model, messages=payload)
+    except Exception:
+        return len(str(payload)) // 4
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """USD cost from litellm's model price map, 0 for models it doesn't know"""
+    try:
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        )
+        return prompt_cost + completion_cost
+    except Exception:
+        return 0.0
+
+
+class LLMUsageTracker:
+    """Latency, token and cost accounting per agent role, plus primary model health"""
+
+    def __init__(self, failure_threshold: int = LLM_FAILURE_THRESHOLD, cooldown: float = LLM_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.roles = {}
+        self.consecutive_failures = {}
+        self.degraded_until = {}
+        self.lock = threading.Lock()
+
+    def _role_stats(self, role: str) -> Dict[str, Any]:
+        if role not in self.roles:
+            self.roles[role] = {
+                'calls': 0,
+                'errors': 0,
+                'fallback_calls': 0,
+                'total_latency': 0.0,
+                'max_latency': 0.0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'cost_usd': 0.0,
+                'models': {}
+            }
+        return self.roles[role]
+
+    def record(self, role: str, model: str, latency: float, success: bool, fallback: bool = False,
+               prompt_tokens: int = 0, completion_tokens: int = 0):
+        with self.lock:
+            stats = self._role_stats(role)
+            stats['calls'] += 1
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            stats['models'][model] = stats['models'].get(model, 0) + 1
+            if fallback:
+                stats['fallback_calls'] += 1
+            if not success:
+                stats['errors'] += 1
+                return
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['cost_usd'] += estimate_cost(model, prompt_tokens, completion_tokens)
+
+    def record_primary_health(self, role: str, healthy: bool):
+        """Track consecutive slow/failed primary calls and trip the cooldown when they pile up"""
+        with self.lock:
+            if healthy:
+                self.consecutive_failures[role] = 0
+                return
+            failures = self.consecutive_failures.get(role, 0) + 1
+            self.consecutive_failures[role] = failures
+            if failures >= self.failure_threshold:
+                self.degraded_until[role] = time.time() + self.cooldown
+                self.consecutive_failures[role] = 0
+
+    def primary_degraded(self, role: str) -> bool:
+        with self.lock:
+            return time.time() < self.degraded_until.get(role, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            report = {}
+            for role, stats in self.roles.items():
+                report[role] = {
+                    **stats,
+                    'models': dict(stats['models']),
+                    'avg_latency': round(stats['total_latency'] / stats['calls'], 3) if stats['calls'] else 0.0,
+                    'cost_usd': round(stats['cost_usd'], 6),
+                    'primary_degraded': time.time() < self.degraded_until.get(role, 0)
+                }
+            return report
+
+
+# Shared across sessions so one shopper's slow primary spares everyone else
+llm_usage = LLMUsageTracker()
+
+
+class TieredLLM(LLM):
+    """CrewAI LLM for one agent role that falls back to a secondary model when the primary is slow or erroring"""
+
+    def __init__(self, role: str, model: str, fallback_model: Optional[str] = None,
+                 tracker: LLMUsageTracker = llm_usage, slow_threshold: float = LLM_SLOW_THRESHOLD, **kwargs):
+        super().__init__(model=model, **kwargs)
+        self.role = role
+        self.tracker = tracker
+        self.slow_threshold = slow_threshold
+        self.fallback_llm = LLM(model=fallback_model, **kwargs) if fallback_model else None
+
+    def call(self, messages, *args, **kwargs):
+        if self.fallback_llm is not None and self.tracker.primary_degraded(self.role):
+            return self._call_fallback(messages, args, kwargs)
+
+        try:
+            response = self._timed_call(None, messages, args, kwargs)
+        except Exception:
+            self.tracker.record_primary_health(self.role, healthy=False)
+            if self.fallback_llm is None:
+                raise
+            return self._call_fallback(messages, args, kwargs)
+
+        return response
+
+    def _call_fallback(self, messages, args, kwargs):
+        """Run the fallback with the primary's current stop words and sampling settings"""
+        for param in SHARED_LLM_PARAMS:
+            if hasattr(self, param):
+                setattr(self.fallback_llm, param, copy.copy(getattr(self, param)))
+        return self._timed_call(self.fallback_llm, messages, args, kwargs, fallback=True)
+
+    def _timed_call(self, llm: Optional[LLM], messages, args, kwargs, fallback: bool = False):
+        """Run one completion on llm (None means this primary) and record its latency, tokens and cost"""
+        model = llm.model if llm is not None else self.model
+        started = time.perf_counter()
+        try:
+            if llm is None:
+                response = super().call(messages, *args, **kwargs)
+            else:
+                response = llm.call(messages, *args, **kwargs)
+        except Exception:
+            self.tracker.record(self.role, model, time.perf_counter() - started, success=False, fallback=fallback)
+            raise
+
+        latency = time.perf_counter() - started
+        if llm is None:
+            self.tracker.record_primary_health(self.role, healthy=latency <= self.slow_threshold)
+        self.tracker.record(
+            self.role, model, latency, success=True, fallback=fallback,
+            prompt_tokens=count_tokens(model, messages),
+            completion_tokens=count_tokens(model, str(response))
+        )
+        return response
+
+
+def build_llm(role: str) -> TieredLLM:
+    """LLM configured for an agent role from MODEL_TIERS"""
+    tier = MODEL_TIERS[role]
+    return TieredLLM(
+        role=role,
+        model=tier['model'],
+        fallback_model=tier.get('fallback') or None,
+        timeout=LLM_TIMEOUT
+    )
@@ -0,0 +1,193 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from intents import is_checkout_message
+
+# Per-shopper limit: sustained messages per minute plus a small burst
+SESSION_RATE_PER_MINUTE = float(os.getenv('RATE_LIMIT_SESSION_PER_MINUTE', '20'))
+SESSION_BURST = float(os.getenv('RATE_LIMIT_SESSION_BURST', '5'))
+# Looser per-address limit on top, so dropping the session cookie doesn't reset a client's allowance.
+# Several shoppers can share an address (office NAT, mobile carriers), hence the higher numbers.
+ADDRESS_RATE_PER_MINUTE = float(os.getenv('RATE_LIMIT_ADDRESS_PER_MINUTE', '120'))
+ADDRESS_BURST = float(os.getenv('RATE_LIMIT_ADDRESS_BURST', '30'))
+# Whole-app limit protecting the LLM quota, checkout messages are charged to it too
+GLOBAL_RATE_PER_SECOND = float(os.getenv('RATE_LIMIT_GLOBAL_PER_SECOND', '5'))
+GLOBAL_BURST = float(os.getenv('RATE_LIMIT_GLOBAL_BURST', '20'))
+# Small extra allowance only checkout messages may draw on once the global bucket is empty
+CHECKOUT_RESERVE_PER_SECOND = float(os.getenv('RATE_LIMIT_CHECKOUT_RESERVE_PER_SECOND', '0.5'))
+CHECKOUT_RESERVE_BURST = float(os.getenv('RATE_LIMIT_CHECKOUT_RESERVE_BURST', '3'))
+# Concurrent crew runs, the reserved slots are only usable by checkout messages
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT_CREWS', '4'))
+CHECKOUT_RESERVED_SLOTS = int(os.getenv('CHECKOUT_RESERVED_SLOTS', '1'))
+# Least recently seen session and address buckets are dropped once there are more than this many of each
+MAX_TRACKED_CLIENTS = int(os.getenv('RATE_LIMIT_MAX_TRACKED_CLIENTS', '10000'))
+
+
+class TokenBucket:
+    """Classic token bucket: refills at rate tokens per second up to capacity"""
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = max(now, self.updated_at)
+
+    def try_take(self, now: Optional[float] = None) -> bool:
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def retry_after(self) -> float:
+        """Seconds until the next token is available"""
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """Per-session, per-address and global rate limiting plus a cap on concurrent crew runs"""
+
+    def __init__(self, session_rate_per_minute: float = SESSION_RATE_PER_MINUTE, session_burst: float = SESSION_BURST,
+                 address_rate_per_minute: float = ADDRESS_RATE_PER_MINUTE, address_burst: float = ADDRESS_BURST,
+                 global_rate_per_second: float = GLOBAL_RATE_PER_SECOND, global_burst: float = GLOBAL_BURST,
+                 checkout_reserve_per_second: float = CHECKOUT_RESERVE_PER_SECOND,
+                 checkout_reserve_burst: float = CHECKOUT_RESERVE_BURST,
+                 max_in_flight: int = MAX_IN_FLIGHT, checkout_reserved: int = CHECKOUT_RESERVED_SLOTS,
+                 max_tracked_clients: int = MAX_TRACKED_CLIENTS):
+        self.session_rate = session_rate_per_minute / 60.0
+        self.session_burst = session_burst
+        self.address_rate = address_rate_per_minute / 60.0
+        self.address_burst = address_burst
+        self.global_bucket = TokenBucket(global_rate_per_second, global_burst)
+        self.checkout_reserve = TokenBucket(checkout_reserve_per_second, checkout_reserve_burst)
+        self.max_in_flight = max_in_flight
+        self.checkout_reserved = min(checkout_reserved, max_in_flight)
+        self.max_tracked_clients = max_tracked_clients
+        # Ordered least recently seen first, so the stalest entries are evicted when the cap is hit
+        self.session_buckets = OrderedDict()
+        self.address_buckets = OrderedDict()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.counters = {
+            'admitted': 0,
+            'admitted_checkout': 0,
+            'admitted_from_checkout_reserve': 0,
+            'rejected_session_rate': 0,
+            'rejected_address_rate': 0,
+            'rejected_global_rate': 0,
+            'rejected_busy': 0
+        }
+        self.lock = threading.Lock()
+
+    def admit(self, session_key: str, address: str, message: str, checkout: bool = False,
+              now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Decide whether a message may start a crew run.
+        address must be something the caller can't reset, such as the remote address.
+        checkout marks messages known from the conversation to complete an order (e.g. a "yes" to
+        the order summary); messages that name checkout themselves are detected here.
+        Admitted requests must be handed back to release() when done.
+        """
+        checkout = checkout or is_checkout_message(message)
+        with self.lock:
+            now = time.monotonic() if now is None else now
+
+            # Check capacity before spending any tokens so a busy rejection costs the shopper nothing
+            limit = self.max_in_flight if checkout else self.max_in_flight - self.checkout_reserved
+            if self.in_flight >= limit:
+                self.counters['rejected_busy'] += 1
+                return self._reject('busy', 'The assistant is busy right now, please try again in a moment.', 1.0)
+
+            session_bucket = self._bucket(self.session_buckets, session_key, self.session_rate, self.session_burst, now)
+            if not session_bucket.try_take(now):
+                self.counters['rejected_session_rate'] += 1
+                return self._reject('session_rate', 'You are sending messages too quickly, please slow down.',
+                                    session_bucket.retry_after())
+
+            address_bucket = self._bucket(self.address_buckets, address, self.address_rate, self.address_burst, now)
+            if not address_bucket.try_take(now):
+                session_bucket.refund()
+                self.counters['rejected_address_rate'] += 1
+                return self._reject('address_rate', 'Too many messages from your network, please slow down.',
+                                    address_bucket.retry_after())
+
+            from_reserve = False
+            if not self.global_bucket.try_take(now):
+                # Checkout gets priority through a small reserve of its own, never an unlimited bypass
+                from_reserve = checkout and self.checkout_reserve.try_take(now)
+                if not from_reserve:
+                    # The shopper did nothing wrong
+                    session_bucket.refund()
+                    address_bucket.refund()
+                    self.counters['rejected_global_rate'] += 1
+                    return self._reject('global_rate', 'The assistant is busy right now, please try again in a moment.',
+                                        self.global_bucket.retry_after())
+
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.counters['admitted'] += 1
+            if checkout:
+                self.counters['admitted_checkout'] += 1
+            if from_reserve:
+                self.counters['admitted_from_checkout_reserve'] += 1
+            return {'admitted': True, 'checkout': checkout}
+
+    def release(self, ticket: Dict[str, Any]):
+        """Free the crew slot taken by an admitted request"""
+        if not ticket.get('admitted'):
+            return
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def _reject(self, reason: str, error: str, retry_after: float) -> Dict[str, Any]:
+        return {
+            'admitted': False,
+            'reason': reason,
+            'error': error,
+            'retry_after': max(1, math.ceil(retry_after))
+        }
+
+    def _bucket(self, buckets: OrderedDict, key: str, rate: float, capacity: float, now: float) -> TokenBucket:
+        """Look up or create a client's bucket and mark it most recently seen; caller holds the lock"""
+        bucket = buckets.get(key)
+        if bucket is None:
+            # A flood of new keys can't grow the table, it only pushes out the stalest entries
+            while buckets and len(buckets) >= self.max_tracked_clients:
+                buckets.popitem(last=False)
+            bucket = TokenBucket(rate, capacity, now)
+            buckets[key] = bucket
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                **self.counters,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'max_in_flight': self.max_in_flight,
+                'checkout_reserved': self.checkout_reserved,
+                'tracked_sessions': len(self.session_buckets),
+                'tracked_addresses': len(self.address_buckets),
+                'global_tokens': round(self.global_bucket.tokens, 2),
+                'checkout_reserve_tokens': round(self.checkout_reserve.tokens, 2)
+            }
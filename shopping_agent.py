@@ -1,10 +1,15 @@
 import json
 import os
+import sys
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, List  # Added missing List import
+from typing import Dict, Any, List, Optional  # Added missing List import
 from crewai import Agent, Task, Crew, Process
 from crewai.tools import tool
 import requests
+from llm_tiers import build_llm
 
 CART_DIR = "cart_data"
 os.makedirs(CART_DIR, exist_ok=True)
@@ -12,6 +17,31 @@ os.makedirs(CART_DIR, exist_ok=True)
 ORDER_URL = f"{{BASE_URL}}/webhook/c619c80d-144d-442a-ac1f-9d898a169950"
 BASE_URL = os.getenv('base_url')
 
+# Resident session budget, sessions beyond it are offloaded to disk and rehydrated on their next message
+SESSION_MEMORY_BUDGET_MB = float(os.getenv('SESSION_MEMORY_BUDGET_MB', '256'))
+SESSION_IDLE_TIMEOUT = float(os.getenv('SESSION_IDLE_TIMEOUT', '900'))
+# How often idle sessions are swept out even when no messages arrive, 0 disables the background sweep
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+# The CrewAI agents and tools aren't worth walking, count them as a flat per-session cost
+AGENT_OVERHEAD_BYTES = int(os.getenv('AGENT_OVERHEAD_BYTES', str(512 * 1024)))
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Approximate memory held by plain JSON-like data (dicts, lists, strings, numbers)"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
 class OrderUploader:
     def __init__(self, cart_file="cart.json"):
         self.cart_file = cart_file
@@ -365,6 +395,10 @@ class PersistentMemoryManager:
         context += "=== END OF MEMORY ===\n"
         return context
 
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the in-memory conversation history"""
+        return deep_sizeof(self.conversations)
+
 
 class MemoryAwareAgent:
     """Crew AI agent with persistent memory capabilities using manager_agent approach"""
@@ -441,6 +475,7 @@ class MemoryAwareAgent:
             ),
             verbose=True,
             allow_delegation=True,
+            llm=build_llm('router'),
         )
 
         # Browsing Agent
@@ -456,7 +491,8 @@ class MemoryAwareAgent:
             ),
             verbose=True,
             allow_delegation=False,
-            tools=[fetch_catalog]
+            tools=[fetch_catalog],
+            llm=build_llm('browsing')
         )
 
         self.order_agent = Agent(
@@ -479,7 +515,8 @@ class MemoryAwareAgent:
             tools=[fetch_catalog, cart_tool, create_order],
             verbose=True,
             allow_delegation=False,
-            max_iter=3
+            max_iter=3,
+            llm=build_llm('order')
 
         )
 
@@ -646,6 +683,217 @@ class MemoryAwareAgent:
         self.memory_manager.conversations = []
         self.memory_manager.save_conversation()
 
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate resident memory of this session, broken down by component"""
+        conversations = self.memory_manager.memory_usage()
+        cart = deep_sizeof(self.cart_manager.cart.cart)
+        return {
+            'conversations': conversations,
+            'cart': cart,
+            'agents': AGENT_OVERHEAD_BYTES,
+            'total': conversations + cart + AGENT_OVERHEAD_BYTES
+        }
+
+    def offload(self):
+        """Flush session state to the on-disk store before the agent is dropped from memory"""
+        self.memory_manager.save_conversation()
+        self.cart_manager.cart.save_cart()
+        self.cart_manager.save_cart()
+
+
+class SessionManager:
+    """
+    Keeps MemoryAwareAgent sessions resident within a memory budget.
+    Idle or least recently used sessions are offloaded to disk and rehydrated lazily.
+    """
+
+    def __init__(self, budget_mb: float = SESSION_MEMORY_BUDGET_MB, idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()  # user_id -> agent, least recently used first
+        self.last_used = {}
+        self.usage = {}
+        self.in_flight = {}
+        self.offloaded_count = 0
+        self.rehydrated_count = 0
+        self.offload_listeners = []  # called with the user_id of every offloaded session
+        self.builds = {}  # user_id -> builders in progress and the offload generation they started from
+        self.persisting = {}  # user_id -> event set once its offload has been written to disk
+        self.lock = threading.RLock()
+
+        self.stop_sweeping = threading.Event()
+        if sweep_interval > 0:
+            sweeper = threading.Thread(target=self._sweep_loop, args=(sweep_interval,), daemon=True)
+            sweeper.start()
+
+    def _sweep_loop(self, interval: float):
+        """Offload idle sessions on a timer so memory is freed even when traffic stops"""
+        while not self.stop_sweeping.wait(interval):
+            try:
+                self.enforce_budget()
+            except Exception as e:
+                print(f"Error sweeping idle sessions: {e}")
+
+    def close(self):
+        """Stop the background sweep"""
+        self.stop_sweeping.set()
+
+    def get_agent(self, user_id: str) -> MemoryAwareAgent:
+        """Return the resident agent for user_id, rehydrating it from disk if needed"""
+        while True:
+            with self.lock:
+                agent = self.sessions.get(user_id)
+                if agent is not None:
+                    return self._checkout(user_id, agent)
+                persisting = self.persisting.get(user_id)
+                if persisting is None:
+                    build = self.builds.setdefault(user_id, {'builders': 0, 'generation': 0})
+                    build['builders'] += 1
+                    generation = build['generation']
+
+            if persisting is not None:
+                # The stores on disk are only current once the offload has finished writing them
+                persisting.wait()
+                continue
+
+            # Building an agent does file I/O and may call the cart webhook, so keep other shoppers unblocked.
+            # Everything the agent needs is already persisted, so a fresh instance picks up where it left off.
+            try:
+                rehydrated = os.path.exists(os.path.join('convo_data', f"{user_id}_conversation.json"))
+                built = MemoryAwareAgent(user_id)
+                usage = built.memory_usage()
+            except Exception:
+                with self.lock:
+                    self._finish_build(user_id, generation)
+                raise
+
+            with self.lock:
+                if self._finish_build(user_id, generation):
+                    agent = self.sessions.get(user_id)
+                    if agent is None:
+                        # Nobody else built this session meanwhile, keep ours
+                        agent = built
+                        self.sessions[user_id] = agent
+                        self.usage[user_id] = usage
+                        if rehydrated:
+                            self.rehydrated_count += 1
+                    return self._checkout(user_id, agent)
+            # The session was offloaded while we were reading the stores, so what we read may be stale
+
+    def _finish_build(self, user_id: str, generation: int) -> bool:
+        """Unregister a build; True if no offload finished since it started. Caller holds the lock"""
+        build = self.builds[user_id]
+        build['builders'] -= 1
+        if build['builders'] == 0:
+            del self.builds[user_id]
+        return build['generation'] == generation
+
+    def _checkout(self, user_id: str, agent: MemoryAwareAgent) -> MemoryAwareAgent:
+        """Mark a resident session as busy; caller holds the lock"""
+        self.sessions.move_to_end(user_id)
+        self.last_used[user_id] = time.time()
+        self.in_flight[user_id] = self.in_flight.get(user_id, 0) + 1
+        return agent
+
+    def release(self, user_id: str):
+        """Refresh accounting for a session after it handled a message, then enforce the budget"""
+        with self.lock:
+            agent = self.sessions.get(user_id)
+            if agent is not None:
+                self.usage[user_id] = agent.memory_usage()
+                self.last_used[user_id] = time.time()
+            if self.in_flight.get(user_id, 0) > 1:
+                self.in_flight[user_id] -= 1
+            else:
+                self.in_flight.pop(user_id, None)
+        self.enforce_budget()
+
+    def offload(self, user_id: str):
+        """Persist a session and drop it from memory"""
+        with self.lock:
+            detached = self._detach(user_id)
+        self._persist(detached)
+
+    def enforce_budget(self):
+        """Offload idle sessions, then least recently used ones until under budget"""
+        with self.lock:
+            now = time.time()
+            # Sessions still handling a message are never offloaded
+            idle = [user_id for user_id in self.sessions if not self.in_flight.get(user_id)]
+
+            detached = []
+            for user_id in idle:
+                if now - self.last_used.get(user_id, now) > self.idle_timeout:
+                    detached += self._detach(user_id)
+
+            for user_id in idle:
+                if self.total_bytes() <= self.budget_bytes:
+                    break
+                detached += self._detach(user_id)
+
+        self._persist(detached)
+
+    def _detach(self, user_id: str) -> List:
+        """Drop a session from the resident set; caller holds the lock and must _persist the result"""
+        agent = self.sessions.pop(user_id, None)
+        if agent is None:
+            return []
+        self.last_used.pop(user_id, None)
+        self.usage.pop(user_id, None)
+        self.offloaded_count += 1
+        self.persisting[user_id] = threading.Event()
+        return [(user_id, agent)]
+
+    def _persist(self, detached: List):
+        """Write detached sessions to disk outside the lock, then let waiting rebuilds through"""
+        for user_id, agent in detached:
+            try:
+                agent.offload()
+                for listener in self.offload_listeners:
+                    listener(user_id)
+            except Exception as e:
+                print(f"Error offloading session {user_id}: {e}")
+            finally:
+                with self.lock:
+                    # Builds that started before this point may have read the old stores
+                    if user_id in self.builds:
+                        self.builds[user_id]['generation'] += 1
+                    self.persisting.pop(user_id).set()
+
+    def last_response(self, user_id: str) -> Optional[str]:
+        """The agent's previous reply to user_id; an offloaded session is read from disk, not rehydrated"""
+        with self.lock:
+            agent = self.sessions.get(user_id)
+        if agent is not None:
+            conversations = agent.memory_manager.conversations
+        else:
+            conversations = PersistentMemoryManager(user_id).conversations
+        return conversations[-1]['agent_response'] if conversations else None
+
+    def total_bytes(self) -> int:
+        return sum(usage['total'] for usage in self.usage.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-session and total memory usage"""
+        with self.lock:
+            now = time.time()
+            return {
+                'budget_bytes': self.budget_bytes,
+                'total_bytes': self.total_bytes(),
+                'resident_sessions': len(self.sessions),
+                'offloaded_count': self.offloaded_count,
+                'rehydrated_count': self.rehydrated_count,
+                'sessions': {
+                    user_id: {
+                        **self.usage.get(user_id, {}),
+                        'in_flight': self.in_flight.get(user_id, 0),
+                        'idle_seconds': round(now - self.last_used.get(user_id, now), 1)
+                    }
+                    for user_id in self.sessions
+                }
+            }
+
 
 class ConversationInterface:
     """Interactive conversation interface"""
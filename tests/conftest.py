@@ -0,0 +1,67 @@
+import importlib.util
+import sys
+import types
+
+
+class StubLLM:
+    """Minimal stand-in for crewai.LLM; tests patch call()"""
+
+    def __init__(self, model: str, timeout=None, temperature=None, stop=None, **kwargs):
+        self.model = model
+        self.timeout = timeout
+        self.temperature = temperature
+        self.stop = stop or []
+        self.additional_params = kwargs
+
+    def call(self, messages, *args, **kwargs):
+        raise NotImplementedError("patch LLM.call in tests")
+
+
+class StubAgent:
+    def __init__(self, tools=None, **kwargs):
+        self.tools = tools or []
+        self.__dict__.update(kwargs)
+
+
+class StubTool:
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+    def run(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+def stub_tool(name):
+    def decorator(func):
+        return StubTool(name, func)
+    return decorator
+
+
+def install_stubs():
+    """Stand in for crewai and litellm when they aren't installed, so the pure Python parts stay testable"""
+    if importlib.util.find_spec("crewai") is None:
+        crewai = types.ModuleType("crewai")
+        crewai.LLM = StubLLM
+        crewai.Agent = StubAgent
+        crewai.Task = lambda **kwargs: types.SimpleNamespace(**kwargs)
+        crewai.Crew = lambda **kwargs: types.SimpleNamespace(**kwargs)
+        crewai.Process = types.SimpleNamespace(hierarchical="hierarchical", sequential="sequential")
+        crewai_tools = types.ModuleType("crewai.tools")
+        crewai_tools.tool = stub_tool
+        crewai.tools = crewai_tools
+        sys.modules["crewai"] = crewai
+        sys.modules["crewai.tools"] = crewai_tools
+
+    if importlib.util.find_spec("litellm") is None:
+        litellm = types.ModuleType("litellm")
+
+        def token_counter(model=None, text=None, messages=None):
+            return len(str(text if text is not None else messages)) // 4
+
+        litellm.token_counter = token_counter
+        litellm.cost_per_token = lambda model, prompt_tokens, completion_tokens: (0.0, 0.0)
+        sys.modules["litellm"] = litellm
+
+
+install_stubs()
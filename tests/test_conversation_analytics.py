@@ -0,0 +1,142 @@
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from conversation_analytics import iter_json_array, iter_cart_rows, to_number, run_export
+
+
+def write_json(path, data, indent=2):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=indent, ensure_ascii=False))
+    return str(path)
+
+
+TURNS = [
+    {"timestamp": "2025-09-14T23:49:02.146440", "user_input": "hey", "agent_response": "Hi! [menu], {cats}"},
+    {"timestamp": "2025-09-14T23:50:27.409220", "user_input": "show, me \"bread\"", "agent_response": "🍞 ₹35"},
+    {"timestamp": "2025-09-14T23:51:04.767566", "user_input": "]", "agent_response": "," * 50},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 65536])
+def test_iter_json_array_matches_json_load(tmp_path, chunk_size):
+    path = write_json(tmp_path / "a_conversation.json", TURNS)
+    assert list(iter_json_array(path, chunk_size)) == TURNS
+
+
+@pytest.mark.parametrize("content", ["", "[]", "  [ ]  ", "{}", "null"])
+def test_iter_json_array_yields_nothing_for_empty_or_non_arrays(tmp_path, content):
+    path = tmp_path / "empty.json"
+    path.write_text(content)
+    assert list(iter_json_array(str(path), 4)) == []
+
+
+def test_iter_json_array_keeps_elements_before_truncation(tmp_path):
+    text = json.dumps(TURNS, indent=2)
+    path = tmp_path / "truncated.json"
+    path.write_text(text[:text.rindex("{") + 10])
+    assert list(iter_json_array(str(path), 16)) == TURNS[:2]
+
+
+def test_iter_json_array_compact_and_scalars(tmp_path):
+    path = write_json(tmp_path / "compact.json", [1, "two", [3], {"four": 4}], indent=None)
+    assert list(iter_json_array(path, 3)) == [1, "two", [3], {"four": 4}]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (45, 45.0),
+    (12.5, 12.5),
+    ("45", 45.0),
+    ("₹45", 45.0),
+    ("₹1,200.50", 1200.5),
+    ("free", None),
+    ("", None),
+    (True, None),
+    (None, None),
+    ([45], None),
+    (float("nan"), None),
+    (float("inf"), None),
+])
+def test_to_number(value, expected):
+    assert to_number(value) == expected
+
+
+def test_iter_cart_rows_coerces_and_skips_bad_items(tmp_path, capsys):
+    memory_dir = tmp_path / "convo_data"
+    write_json(memory_dir / "alice_cart.json", {"cart_id": "c1", "items": [
+        {"variant_id": "v1", "product_name": "Brown Bread", "price": "₹45", "quantity": 3, "subtotal": "454545"},
+        {"variant_id": "v2", "product_name": "Buns", "price": "call us", "quantity": 1, "subtotal": 0},
+        {"variant_id": "v3", "product_name": "Cookies", "price": 170, "quantity": 1.5, "subtotal": 255},
+        "not an item",
+    ]})
+    (memory_dir / "broken_cart.json").write_text("{not json")
+
+    rows = list(iter_cart_rows(str(memory_dir), str(tmp_path / "cart_data")))
+
+    assert rows == [{
+        "user_id": "alice", "cart_id": "c1", "variant_id": "v1", "product_name": "Brown Bread",
+        "price": 45.0, "quantity": 3, "subtotal": 135.0,
+    }]
+    output = capsys.readouterr().out
+    assert "broken_cart.json" in output
+    assert "'call us'" in output
+    assert "1.5" in output
+
+
+def test_iter_cart_rows_prefers_convo_data_over_cart_data_snapshot(tmp_path):
+    memory_dir, cart_dir = tmp_path / "convo_data", tmp_path / "cart_data"
+    item = {"variant_id": "v1", "product_name": "Buns", "price": 135, "quantity": 1}
+    write_json(memory_dir / "alice_cart.json", {"cart_id": "c1", "items": [item]})
+    write_json(cart_dir / "alice_cart.json", {"items": [item, item]})
+    write_json(cart_dir / "bob_cart.json", {"items": [item]})
+
+    users = [row["user_id"] for row in iter_cart_rows(str(memory_dir), str(cart_dir))]
+    assert users == ["alice", "bob"]
+
+
+def test_run_export_open_cart_rate_uses_conversation_population(tmp_path):
+    memory_dir, cart_dir = tmp_path / "convo_data", tmp_path / "cart_data"
+    item = {"variant_id": "v1", "product_name": "Buns", "price": 135, "quantity": 2}
+    write_json(memory_dir / "alice_conversation.json", TURNS)
+    write_json(memory_dir / "bob_conversation.json", [
+        {"timestamp": "2025-09-15T10:00:00", "user_input": "checkout please", "agent_response": "Done"},
+    ])
+    write_json(memory_dir / "alice_cart.json", {"cart_id": "c1", "items": [item]})
+    # Cart-only shoppers have no conversation rows and must not push the rate above 1
+    write_json(cart_dir / "carol_cart.json", {"items": [item]})
+    write_json(memory_dir / "dave_conversation.json", [])
+    write_json(memory_dir / "dave_cart.json", {"cart_id": "c4", "items": [item]})
+
+    for file_format in ("parquet", "arrow"):
+        report = run_export(str(memory_dir), str(cart_dir), str(tmp_path / file_format), file_format)
+
+        assert report["total_users"] == 2
+        assert report["total_turns"] == 4
+        assert report["open_cart_rate"] == 0.5
+        assert report["checkout_intent_rate"] == 0.5
+        assert report["top_carted_products"] == [{"product_name": "Buns", "quantity": 6}]
+        assert report["intent_counts"]["checkout"] == 1
+        assert (tmp_path / file_format / "summary.json").exists()
+
+
+def test_run_export_counts_product_mentions(tmp_path):
+    memory_dir = tmp_path / "convo_data"
+    write_json(memory_dir / "alice_conversation.json", [
+        {"timestamp": "2025-09-15T10:00:00", "user_input": "Do you have brown bread?", "agent_response": ""},
+        {"timestamp": "2025-09-15T10:01:00", "user_input": "2 BROWN BREAD please", "agent_response": ""},
+        {"timestamp": "2025-09-15T10:02:00", "user_input": "and buns", "agent_response": ""},
+    ])
+    catalog = write_json(tmp_path / "catalog.json", [{"data": [
+        {"variant_id": "v1", "product_name": "Brown Bread", "price": 45},
+        {"variant_id": "v2", "product_name": "Buns", "price": 135},
+        {"variant_id": "v3", "product_name": "Cookies", "price": 170},
+    ]}])
+
+    report = run_export(str(memory_dir), str(tmp_path / "cart_data"), str(tmp_path / "out"), catalog_path=catalog)
+
+    assert report["top_searched_products"] == [
+        {"product_name": "Brown Bread", "mentions": 2},
+        {"product_name": "Buns", "mentions": 1},
+    ]
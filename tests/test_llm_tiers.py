@@ -0,0 +1,152 @@
+import pytest
+
+import llm_tiers
+from llm_tiers import LLMUsageTracker, TieredLLM
+
+PRIMARY = "primary-model"
+FALLBACK = "fallback-model"
+
+
+class CallLog(list):
+    """(model, stop words) of every completion made"""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Replace the underlying completion; models listed in calls.failing raise instead of answering"""
+    log = CallLog()
+
+    def fake_call(llm, messages, *args, **kwargs):
+        log.append((llm.model, list(llm.stop)))
+        if llm.model in log.failing:
+            raise TimeoutError(f"{llm.model} timed out")
+        return f"answer from {llm.model}"
+
+    monkeypatch.setattr(llm_tiers.LLM, "call", fake_call)
+    return log
+
+
+def make_llm(role="router", failure_threshold=3, cooldown=60, **kwargs):
+    tracker = LLMUsageTracker(failure_threshold=failure_threshold, cooldown=cooldown)
+    return TieredLLM(role=role, model=PRIMARY, fallback_model=FALLBACK, tracker=tracker, **kwargs)
+
+
+def test_primary_answers_when_healthy(calls):
+    llm = make_llm()
+
+    assert llm.call("hi") == f"answer from {PRIMARY}"
+    assert [model for model, _ in calls] == [PRIMARY]
+
+
+def test_falls_back_when_primary_raises(calls):
+    llm = make_llm()
+    calls.failing.add(PRIMARY)
+
+    assert llm.call("hi") == f"answer from {FALLBACK}"
+    assert [model for model, _ in calls] == [PRIMARY, FALLBACK]
+
+    stats = llm.tracker.stats()["router"]
+    assert stats["calls"] == 2
+    assert stats["errors"] == 1
+    assert stats["fallback_calls"] == 1
+    assert stats["models"] == {PRIMARY: 1, FALLBACK: 1}
+
+
+def test_error_propagates_without_fallback(calls):
+    llm = TieredLLM(role="router", model=PRIMARY, tracker=LLMUsageTracker())
+    calls.failing.add(PRIMARY)
+
+    with pytest.raises(TimeoutError):
+        llm.call("hi")
+
+
+def test_fallback_gets_the_primarys_stop_words(calls):
+    llm = make_llm()
+    calls.failing.add(PRIMARY)
+    # CrewAI's executor sets the ReAct stop words on the agent's LLM after it is built
+    llm.stop = ["\nObservation:"]
+
+    llm.call("hi")
+
+    assert calls[-1] == (FALLBACK, ["\nObservation:"])
+    assert llm.fallback_llm.stop is not llm.stop
+
+
+def test_slow_primary_calls_count_as_unhealthy(calls):
+    llm = make_llm(failure_threshold=2, slow_threshold=-1)
+
+    llm.call("hi")
+    assert not llm.tracker.primary_degraded("router")
+    llm.call("hi")
+
+    assert llm.tracker.primary_degraded("router")
+    assert [model for model, _ in calls] == [PRIMARY, PRIMARY]
+    assert llm.tracker.stats()["router"]["errors"] == 0  # slow answers are still used
+
+
+def test_healthy_call_resets_the_failure_streak(calls):
+    llm = make_llm(failure_threshold=2)
+
+    calls.failing.add(PRIMARY)
+    llm.call("hi")
+    calls.failing.clear()
+    llm.call("hi")
+    calls.failing.add(PRIMARY)
+    llm.call("hi")
+
+    assert not llm.tracker.primary_degraded("router")
+
+
+def test_cooldown_skips_the_primary(calls):
+    llm = make_llm(failure_threshold=1)
+    calls.failing.add(PRIMARY)
+    llm.call("hi")
+    calls.failing.clear()
+
+    assert llm.call("hi") == f"answer from {FALLBACK}"
+    assert [model for model, _ in calls] == [PRIMARY, FALLBACK, FALLBACK]
+
+
+def test_primary_is_retried_after_the_cooldown(calls):
+    llm = make_llm(failure_threshold=1, cooldown=0)
+    calls.failing.add(PRIMARY)
+    llm.call("hi")
+    calls.failing.clear()
+
+    assert llm.call("hi") == f"answer from {PRIMARY}"
+
+
+def test_counters_are_kept_per_role(calls):
+    tracker = LLMUsageTracker()
+    router = TieredLLM(role="router", model=PRIMARY, fallback_model=FALLBACK, tracker=tracker)
+    order = TieredLLM(role="order", model=PRIMARY, fallback_model=FALLBACK, tracker=tracker)
+
+    router.call("hi")
+    router.call("again")
+    calls.failing.add(PRIMARY)
+    order.call("checkout")
+
+    stats = tracker.stats()
+    assert stats["router"]["calls"] == 2
+    assert stats["router"]["fallback_calls"] == 0
+    assert stats["router"]["completion_tokens"] > 0
+    assert stats["order"]["calls"] == 2
+    assert stats["order"]["errors"] == 1
+    assert stats["order"]["fallback_calls"] == 1
+
+
+def test_primary_health_is_kept_per_role(calls):
+    tracker = LLMUsageTracker(failure_threshold=1)
+    router = TieredLLM(role="router", model=PRIMARY, fallback_model=FALLBACK, tracker=tracker)
+    order = TieredLLM(role="order", model=PRIMARY, fallback_model=FALLBACK, tracker=tracker)
+    calls.failing.add(PRIMARY)
+
+    router.call("hi")
+    calls.failing.clear()
+
+    assert tracker.primary_degraded("router")
+    assert order.call("checkout") == f"answer from {PRIMARY}"
@@ -0,0 +1,199 @@
+import time
+import uuid
+
+import pytest
+
+from intents import is_order_confirmation
+from rate_limiter import TokenBucket, AdmissionController
+
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(rate=1.0, capacity=3, now=0.0)
+    assert [bucket.try_take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == 1.0
+
+    assert not bucket.try_take(0.5)
+    assert bucket.try_take(1.0)
+    assert not bucket.try_take(1.0)
+
+
+def test_token_bucket_never_exceeds_capacity():
+    bucket = TokenBucket(rate=10.0, capacity=2, now=0.0)
+    bucket.try_take(0.0)
+    assert bucket.is_full(100.0)
+    assert bucket.tokens == 2
+    bucket.refund()
+    assert bucket.tokens == 2
+
+
+def test_token_bucket_ignores_clock_going_backwards():
+    bucket = TokenBucket(rate=1.0, capacity=1, now=10.0)
+    assert bucket.try_take(5.0)
+    assert not bucket.try_take(5.0)
+
+
+def make_controller(**overrides):
+    settings = dict(session_rate_per_minute=0, session_burst=5, address_rate_per_minute=0, address_burst=50,
+                    global_rate_per_second=0, global_burst=20, checkout_reserve_per_second=0,
+                    checkout_reserve_burst=3, max_in_flight=100, checkout_reserved=1)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+def admit_and_release(controller, session_key, address, message, now, **kwargs):
+    ticket = controller.admit(session_key, address, message, now=now, **kwargs)
+    controller.release(ticket)
+    return ticket
+
+
+def test_session_limit_applies_per_shopper():
+    controller = make_controller()
+    now = time.monotonic()
+
+    # Shoppers behind the same office NAT don't use up each other's allowance
+    first = [admit_and_release(controller, 'web_a', '198.51.100.1', 'hi', now)['admitted'] for _ in range(10)]
+    second = [admit_and_release(controller, 'web_b', '198.51.100.1', 'hi', now)['admitted'] for _ in range(10)]
+
+    assert sum(first) == 5
+    assert sum(second) == 5
+    assert controller.stats()['rejected_session_rate'] == 10
+
+
+def test_address_limit_survives_dropped_session_cookies():
+    controller = make_controller(global_burst=1000)
+    now = time.monotonic()
+
+    # A cookieless client gets a new session id every time but keeps the same address
+    admitted = [
+        admit_and_release(controller, f"web_{uuid.uuid4().hex[:12]}", '203.0.113.7', 'hello', now)['admitted']
+        for _ in range(1000)
+    ]
+
+    assert sum(admitted) == 50
+    assert controller.stats()['rejected_address_rate'] == 950
+
+
+def test_address_rejection_refunds_the_session_token():
+    controller = make_controller(address_burst=0, session_burst=1)
+    now = time.monotonic()
+
+    assert controller.admit('web_a', 'x', 'hi', now=now)['reason'] == 'address_rate'
+    assert controller.session_buckets['web_a'].tokens == 1
+
+
+def test_checkout_messages_are_charged_to_the_global_bucket():
+    controller = make_controller(session_burst=1000, address_burst=1000)
+    now = time.monotonic()
+
+    results = [admit_and_release(controller, f"web_{i}", f"10.0.{i // 250}.{i % 250}", "hello, confirm my order", now)
+               for i in range(1000)]
+
+    # The global burst plus the small checkout reserve, nothing more
+    assert sum(r['admitted'] for r in results) == 20 + 3
+    stats = controller.stats()
+    assert stats['global_tokens'] == 0
+    assert stats['admitted_from_checkout_reserve'] == 3
+    assert stats['rejected_global_rate'] == 1000 - 23
+
+
+def test_checkout_reserve_is_not_available_to_other_messages():
+    controller = make_controller(global_burst=1)
+    now = time.monotonic()
+
+    assert controller.admit('a', 'a', 'show me bread', now=now)['admitted']
+    rejected = controller.admit('b', 'b', 'show me cookies', now=now)
+    assert not rejected['admitted']
+    assert rejected['reason'] == 'global_rate'
+    assert controller.admit('c', 'c', 'checkout please', now=now)['admitted']
+
+
+def test_confirmation_flag_marks_a_bare_yes_as_checkout():
+    controller = make_controller(global_burst=0)
+    now = time.monotonic()
+
+    assert controller.admit('a', 'a', 'yes', now=now)['reason'] == 'global_rate'
+    ticket = controller.admit('a', 'a', 'yes', checkout=True, now=now)
+    assert ticket == {'admitted': True, 'checkout': True}
+    assert controller.stats()['admitted_from_checkout_reserve'] == 1
+
+
+def test_global_rejection_refunds_the_client_tokens():
+    controller = make_controller(global_burst=0, session_burst=1, address_burst=1)
+    now = time.monotonic()
+
+    assert controller.admit('web_a', 'a', 'hi', now=now)['reason'] == 'global_rate'
+    assert controller.session_buckets['web_a'].tokens == 1
+    assert controller.address_buckets['a'].tokens == 1
+
+
+def test_reserved_slots_only_admit_checkout():
+    controller = make_controller(max_in_flight=2, checkout_reserved=1)
+    now = time.monotonic()
+
+    first = controller.admit('a', 'a', 'hi', now=now)
+    assert first['admitted']
+
+    busy = controller.admit('b', 'b', 'hello', now=now)
+    assert not busy['admitted']
+    assert busy['reason'] == 'busy'
+
+    checkout = controller.admit('c', 'c', 'checkout', now=now)
+    assert checkout['admitted']
+    assert not controller.admit('d', 'd', 'place my order', now=now)['admitted']
+
+    controller.release(first)
+    controller.release(checkout)
+    assert controller.stats()['in_flight'] == 0
+    assert controller.stats()['peak_in_flight'] == 2
+
+
+def test_busy_rejection_does_not_spend_tokens():
+    controller = make_controller(max_in_flight=1, checkout_reserved=0, session_burst=2)
+    now = time.monotonic()
+
+    ticket = controller.admit('web_a', 'a', 'hi', now=now)
+    assert controller.admit('web_a', 'a', 'hi again', now=now)['reason'] == 'busy'
+    assert controller.session_buckets['web_a'].tokens == 1
+    controller.release(ticket)
+
+
+def test_tracked_clients_are_capped_by_evicting_the_least_recently_seen():
+    controller = make_controller(session_rate_per_minute=60, max_tracked_clients=2)
+    now = time.monotonic()
+
+    admit_and_release(controller, 'a', 'a', 'hi', now)
+    admit_and_release(controller, 'b', 'b', 'hi', now + 1)
+    admit_and_release(controller, 'a', 'a', 'hi', now + 2)
+    admit_and_release(controller, 'c', 'c', 'hi', now + 3)
+
+    assert list(controller.session_buckets) == ['a', 'c']
+    assert list(controller.address_buckets) == ['a', 'c']
+
+
+def test_address_flood_does_not_grow_the_bucket_table():
+    controller = make_controller(global_burst=10000, max_tracked_clients=100)
+    now = time.monotonic()
+
+    # Every bucket is still draining, so none of them is full
+    for i in range(5000):
+        admit_and_release(controller, f"web_{i}", f"10.{i // 65536}.{i // 256 % 256}.{i % 256}", 'hi', now)
+
+    stats = controller.stats()
+    assert stats['tracked_sessions'] == 100
+    assert stats['tracked_addresses'] == 100
+
+
+ORDER_SUMMARY = "🛒 Order Summary:\n• Brown bread × 2 = ₹90\n\nTotal: ₹90\n\nReady to place your order? (Type 'yes' to confirm)"
+
+
+@pytest.mark.parametrize("message, previous_reply, expected", [
+    ("yes", ORDER_SUMMARY, True),
+    ("Yes please!", ORDER_SUMMARY, True),
+    ("ok go ahead", "Would you like to add more items or proceed to checkout?", True),
+    ("yes", "Here are our breads: Brown bread ₹45", False),
+    ("yes", None, False),
+    ("no, add cookies first", ORDER_SUMMARY, False),
+    ("yes but add two more chocolate cookies to my cart", ORDER_SUMMARY, False),
+])
+def test_order_confirmation_depends_on_the_previous_reply(message, previous_reply, expected):
+    assert is_order_confirmation(message, previous_reply) is expected
@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+AGENT_MB = 0.5  # AGENT_OVERHEAD_BYTES dominates a fresh session's footprint
+
+
+@pytest.fixture
+def shopping_agent(tmp_path, monkeypatch):
+    """shopping_agent with crewai stubbed, working in a scratch store and with no webhook access"""
+    monkeypatch.chdir(tmp_path)
+    import shopping_agent
+    os.makedirs(shopping_agent.CART_DIR, exist_ok=True)  # created at import time, possibly in another directory
+
+    def no_network(*args, **kwargs):
+        raise ConnectionError("network disabled in tests")
+
+    monkeypatch.setattr(shopping_agent.requests, "post", no_network)
+    monkeypatch.setattr(shopping_agent.requests, "get", no_network)
+    return shopping_agent
+
+
+def make_manager(shopping_agent, sessions_in_budget=2, **kwargs):
+    settings = dict(budget_mb=AGENT_MB * sessions_in_budget + 0.25, idle_timeout=3600, sweep_interval=0)
+    settings.update(kwargs)
+    return shopping_agent.SessionManager(**settings)
+
+
+def handle(manager, user_id, message=None):
+    """One request: check the session out, record a turn, release it"""
+    agent = manager.get_agent(user_id)
+    if message:
+        agent.memory_manager.add_conversation(message, "ok")
+    manager.release(user_id)
+    return agent
+
+
+def stored_turns(user_id):
+    with open(f"convo_data/{user_id}_conversation.json") as f:
+        return [conv["user_input"] for conv in json.load(f)]
+
+
+def test_least_recently_used_sessions_are_offloaded_over_budget(shopping_agent):
+    manager = make_manager(shopping_agent)
+
+    handle(manager, "a")
+    handle(manager, "b")
+    handle(manager, "a")
+    handle(manager, "c")
+
+    assert list(manager.sessions) == ["a", "c"]
+    assert manager.offloaded_count == 1
+    assert manager.total_bytes() <= manager.budget_bytes
+
+
+def test_offloaded_session_is_rehydrated_from_disk(shopping_agent):
+    manager = make_manager(shopping_agent, sessions_in_budget=1)
+
+    first = handle(manager, "a", "hello")
+    handle(manager, "b")
+    assert "a" not in manager.sessions
+
+    again = handle(manager, "a", "again")
+    assert again is not first
+    assert [c["user_input"] for c in again.memory_manager.conversations] == ["hello", "again"]
+    assert manager.rehydrated_count == 1
+
+
+def test_in_flight_sessions_are_never_offloaded(shopping_agent):
+    manager = make_manager(shopping_agent, sessions_in_budget=0, idle_timeout=0)
+
+    busy = manager.get_agent("busy")
+    handle(manager, "other")
+    manager.enforce_budget()
+
+    assert list(manager.sessions) == ["busy"]
+    assert manager.get_agent("busy") is busy  # a second concurrent request on the same session
+    manager.release("busy")
+    manager.enforce_budget()
+    assert "busy" in manager.sessions
+
+    manager.release("busy")
+    assert manager.sessions == {}
+
+
+def test_idle_sessions_are_offloaded_after_timeout(shopping_agent):
+    manager = make_manager(shopping_agent, idle_timeout=0.05)
+
+    handle(manager, "a")
+    manager.enforce_budget()
+    assert "a" in manager.sessions
+
+    time.sleep(0.1)
+    manager.enforce_budget()
+    assert "a" not in manager.sessions
+
+
+def test_background_sweep_offloads_idle_sessions_without_traffic(shopping_agent):
+    manager = make_manager(shopping_agent, idle_timeout=0.05, sweep_interval=0.02)
+    try:
+        handle(manager, "a")
+        deadline = time.time() + 2
+        while "a" in manager.sessions and time.time() < deadline:
+            time.sleep(0.01)
+        assert "a" not in manager.sessions
+    finally:
+        manager.close()
+
+
+def test_offload_listeners_fire_after_persisting_and_outside_the_lock(shopping_agent):
+    manager = make_manager(shopping_agent, sessions_in_budget=1)
+    calls = []
+
+    def listener(user_id):
+        # Another shopper must be able to use the manager while an offload is being written
+        other = threading.Thread(target=manager.stats)
+        other.start()
+        other.join(timeout=2)
+        calls.append((user_id, stored_turns(user_id), other.is_alive()))
+
+    manager.offload_listeners.append(listener)
+    handle(manager, "a", "hello")
+    handle(manager, "b")
+
+    assert calls == [("a", ["hello"], False)]
+
+
+def test_build_racing_an_offload_does_not_resurrect_stale_state(shopping_agent, monkeypatch):
+    manager = make_manager(shopping_agent)
+    stale_read_done = threading.Event()
+    resume_stale_build = threading.Event()
+    original_cart_manager = shopping_agent.PersistentCartManager
+
+    class GatedCartManager(original_cart_manager):
+        def __init__(self, user_id):
+            # The conversation store has been read by now; hold thread A here
+            if threading.current_thread().name == "A" and not stale_read_done.is_set():
+                stale_read_done.set()
+                resume_stale_build.wait(timeout=5)
+            super().__init__(user_id)
+
+    monkeypatch.setattr(shopping_agent, "PersistentCartManager", GatedCartManager)
+
+    result = {}
+
+    def thread_a():
+        agent = manager.get_agent("u")
+        agent.memory_manager.add_conversation("from A", "ok")
+        manager.release("u")
+        result["agent"] = agent
+
+    a = threading.Thread(target=thread_a, name="A")
+    a.start()
+    assert stale_read_done.wait(timeout=5)
+
+    # Meanwhile B builds the same shopper, runs a turn and gets offloaded
+    handle(manager, "u", "from B")
+    manager.offload("u")
+    assert stored_turns("u") == ["from B"]
+
+    resume_stale_build.set()
+    a.join(timeout=5)
+
+    assert [c["user_input"] for c in result["agent"].memory_manager.conversations] == ["from B", "from A"]
+    assert stored_turns("u") == ["from B", "from A"]
+    assert manager.builds == {}
+    assert manager.persisting == {}
+
+
+def test_failed_build_is_unregistered(shopping_agent, monkeypatch):
+    manager = make_manager(shopping_agent)
+
+    def broken(user_id):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(shopping_agent, "MemoryAwareAgent", broken)
+    with pytest.raises(RuntimeError):
+        manager.get_agent("u")
+    assert manager.builds == {}
+
+
+def test_last_response_comes_from_resident_or_offloaded_sessions(shopping_agent):
+    manager = make_manager(shopping_agent, sessions_in_budget=1)
+    assert manager.last_response("a") is None
+
+    agent = manager.get_agent("a")
+    agent.memory_manager.add_conversation("checkout", "Ready to place your order? (Type 'yes' to confirm)")
+    manager.release("a")
+    assert manager.last_response("a").startswith("Ready to place your order?")
+
+    handle(manager, "b")
+    assert "a" not in manager.sessions
+    assert manager.last_response("a").startswith("Ready to place your order?")
+    assert "a" not in manager.sessions
@@ -0,0 +1,75 @@
+import pytest
+import requests
+
+import turn_recorder
+from turn_recorder import TurnRecorder, TurnReplayer, fingerprint, rebuild_error
+
+URL = "https://hooks.example.com/webhook/cart"
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(turn_recorder, "install_hooks", lambda: None)
+    return TurnRecorder(str(tmp_path / "session.jsonl.gz"), "web_test")
+
+
+def replay_turn(recorder):
+    """Write the recorder's pending events as one turn and load it back for replay"""
+    recorder._write([{"type": "turn", "turn": 1, "input": "add milk"}] + recorder.turn_events
+                    + [{"type": "turn_end", "turn": 1, "output": "ok"}])
+    replayer = TurnReplayer(recorder.path)
+    replayer.start_turn(replayer.turns[0])
+    return replayer
+
+
+def test_fingerprint_ignores_cart_timestamps():
+    first = [{"role": "user", "content": '{"items": [{"name": "Milk", "added_at": "2026-10-19T09:15:02.123456"}]}'}]
+    later = [{"role": "user", "content": '{"items": [{"name": "Milk", "added_at": "2026-10-20T18:40:55.000001"}]}'}]
+    changed = [{"role": "user", "content": '{"items": [{"name": "Eggs", "added_at": "2026-10-19T09:15:02.123456"}]}'}]
+
+    assert fingerprint(first) == fingerprint(later)
+    assert fingerprint(first) != fingerprint(changed)
+
+
+def test_webhook_response_is_replayed(recorder):
+    def call():
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = b'{"status": "success"}'
+        return response
+
+    recorder.on_http("POST", URL, call)
+    replayer = replay_turn(recorder)
+
+    response = replayer.on_http("POST", URL, None)
+    assert response.status_code == 200
+    assert response.json() == {"status": "success"}
+
+
+def test_webhook_failure_is_recorded_and_replayed(recorder):
+    def call():
+        raise requests.exceptions.ReadTimeout("read timed out")
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        recorder.on_http("POST", URL, call)
+    assert recorder.turn_events[0]["error"]["type"] == "ReadTimeout"
+
+    replayer = replay_turn(recorder)
+    with pytest.raises(requests.exceptions.ReadTimeout, match="read timed out"):
+        replayer.on_http("POST", URL, None)
+    assert replayer.drift["misses"] == 0
+
+
+@pytest.mark.parametrize("error, expected", [
+    ({"type": "ConnectionError", "module": "requests.exceptions", "message": "refused"},
+     requests.exceptions.ConnectionError),
+    ({"type": "ValueError", "module": "builtins", "message": "bad"}, ValueError),
+    ({"type": "SSLError", "module": "urllib3.exceptions", "message": "handshake"},
+     requests.exceptions.RequestException),
+])
+def test_rebuild_error(error, expected):
+    rebuilt = rebuild_error(error)
+    assert type(rebuilt) is expected
+    assert str(rebuilt) == error["message"]
@@ -0,0 +1,415 @@
+import argparse
+import builtins
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import requests
+import requests.api
+import requests.exceptions
+
+from llm_tiers import TieredLLM
+
+# Store files a session reads on startup, snapshotted so a replay starts from the recorded state
+SNAPSHOT_FILES = [
+    os.path.join('convo_data', '{user_id}_conversation.json'),
+    os.path.join('convo_data', '{user_id}_cart.json'),
+    os.path.join('cart_data', '{user_id}_cart.json'),
+]
+
+_active = threading.local()
+_hooks_lock = threading.Lock()
+_original_llm_call = None
+_original_http_request = None
+
+
+# Cart and conversation timestamps embedded in prompts, which differ on every replay
+VOLATILE_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?([+-]\d{2}:\d{2}|Z)?")
+
+
+class ReplayMissError(Exception):
+    """Raised when a replayed turn makes a call the log has no recording for"""
+
+
+def fingerprint(payload) -> str:
+    """Short stable hash used to spot drift without storing full prompts; timestamps are ignored"""
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    encoded = VOLATILE_TIMESTAMP.sub('<timestamp>', encoded)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+def describe_error(error: Exception) -> Dict[str, str]:
+    return {'type': type(error).__name__, 'module': type(error).__module__, 'message': str(error)}
+
+
+def rebuild_error(error: Dict[str, str]) -> Exception:
+    """Recreate a recorded webhook failure, as a RequestException if the original type isn't importable"""
+    if error['module'].startswith('requests'):
+        error_type = getattr(requests.exceptions, error['type'], None)
+    else:
+        error_type = getattr(builtins, error['type'], None)
+    if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+        error_type = requests.exceptions.RequestException
+    return error_type(error['message'])
+
+
+def current_session():
+    return getattr(_active, 'session', None)
+
+
+@contextmanager
+def activate(session):
+    """Route this thread's LLM, tool and webhook calls through session for the duration"""
+    previous = current_session()
+    _active.session = session
+    try:
+        yield session
+    finally:
+        _active.session = previous
+
+
+def install_hooks():
+    """Patch the LLM and HTTP entry points once; they are pass-through unless a session is active"""
+    global _original_llm_call, _original_http_request
+    with _hooks_lock:
+        if _original_llm_call is not None:
+            return
+        _original_llm_call = TieredLLM.call
+        _original_http_request = requests.api.request
+
+        def llm_call(llm, messages, *args, **kwargs):
+            session = current_session()
+            if session is None:
+                return _original_llm_call(llm, messages, *args, **kwargs)
+            return session.on_llm(llm.role, llm.model, messages,
+                                  lambda: _original_llm_call(llm, messages, *args, **kwargs))
+
+        def http_request(method, url, **kwargs):
+            session = current_session()
+            if session is None:
+                return _original_http_request(method, url, **kwargs)
+            return session.on_http(method.upper(), url, lambda: _original_http_request(method, url, **kwargs))
+
+        TieredLLM.call = llm_call
+        requests.api.request = http_request
+
+
+def wrap_agent_tools(agent):
+    """Route a MemoryAwareAgent's tool calls through the active session"""
+    seen = set()
+    for crew_agent in (agent.router_agent, agent.browsing_agent, agent.order_agent):
+        for crew_tool in crew_agent.tools or []:
+            if id(crew_tool) in seen:
+                continue
+            seen.add(id(crew_tool))
+            original = crew_tool.func
+
+            def tool_call(*args, _name=crew_tool.name, _original=original, **kwargs):
+                session = current_session()
+                if session is None:
+                    return _original(*args, **kwargs)
+                return session.on_tool(_name, args, kwargs, lambda: _original(*args, **kwargs))
+
+            crew_tool.func = tool_call
+
+
+class TurnSession:
+    """Per-turn stage timing shared by recording and replay"""
+
+    def __init__(self):
+        self.turn_events = []
+        self.reset_timers()
+
+    def reset_timers(self):
+        self.turn_events = []
+        self.stages = {'llm': 0.0, 'tools': 0.0, 'http': 0.0}
+        self.tool_depth = 0
+
+    def stage_report(self, wall_time: float) -> Dict[str, float]:
+        """Stage breakdown of a turn, crew is whatever CrewAI itself spent around the calls"""
+        crew = wall_time - self.stages['llm'] - self.stages['tools'] - self.stages['http']
+        return {
+            'llm': round(self.stages['llm'], 4),
+            'tools': round(self.stages['tools'], 4),
+            'http': round(self.stages['http'], 4),
+            'crew': round(max(crew, 0.0), 4)
+        }
+
+    def timed(self, stage: str, call):
+        started = time.perf_counter()
+        try:
+            return call()
+        finally:
+            self.stages[stage] += time.perf_counter() - started
+
+    def run_tool(self, call):
+        """Time a tool call excluding the webhook time spent inside it"""
+        http_before = self.stages['http']
+        started = time.perf_counter()
+        self.tool_depth += 1
+        try:
+            return call()
+        finally:
+            self.tool_depth -= 1
+            elapsed = time.perf_counter() - started
+            if self.tool_depth == 0:
+                self.stages['tools'] += elapsed - (self.stages['http'] - http_before)
+
+
+class TurnRecorder(TurnSession):
+    """Captures each turn's input, LLM request/response pairs, tool calls and webhook responses"""
+
+    def __init__(self, path: str, user_id: str):
+        super().__init__()
+        self.path = path
+        self.user_id = user_id
+        self.turn = 0
+        self.attached_agent = None  # weakref, so an offloaded agent can actually be freed
+        self.lock = threading.Lock()
+        install_hooks()
+
+        snapshot = {}
+        for template in SNAPSHOT_FILES:
+            store_path = template.format(user_id=user_id)
+            if os.path.exists(store_path):
+                with open(store_path, 'r') as f:
+                    snapshot[store_path] = f.read()
+        self._write([{
+            'type': 'session',
+            'user_id': user_id,
+            'started_at': datetime.now().isoformat(),
+            'snapshot': snapshot
+        }])
+
+    def _write(self, events: List[Dict[str, Any]]):
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, separators=(',', ':'), ensure_ascii=False, default=str) + '\n')
+
+    def process_conversation(self, agent, user_input: str) -> str:
+        """Run one turn on agent and append everything it did to the log"""
+        with self.lock:
+            if self.attached_agent is None or self.attached_agent() is not agent:
+                # Sessions can be rehydrated as new agent instances, their tools need wrapping again
+                wrap_agent_tools(agent)
+                self.attached_agent = weakref.ref(agent)
+
+            self.turn += 1
+            self.reset_timers()
+            started = time.perf_counter()
+            with activate(self):
+                response = agent.process_conversation(user_input)
+            wall_time = time.perf_counter() - started
+
+            self._write(
+                [{'type': 'turn', 'turn': self.turn, 'input': user_input}]
+                + self.turn_events
+                + [{
+                    'type': 'turn_end',
+                    'turn': self.turn,
+                    'output': response,
+                    'wall_time': round(wall_time, 4),
+                    'stages': self.stage_report(wall_time)
+                }]
+            )
+            return response
+
+    def on_llm(self, role: str, model: str, messages, call):
+        started = time.perf_counter()
+        response = self.timed('llm', call)
+        self.turn_events.append({
+            'type': 'llm',
+            'role': role,
+            'model': model,
+            'request': fingerprint(messages),
+            'response': response,
+            'latency': round(time.perf_counter() - started, 4)
+        })
+        return response
+
+    def on_http(self, method: str, url: str, call):
+        started = time.perf_counter()
+        try:
+            response = self.timed('http', call)
+        except Exception as e:
+            # Webhook timeouts and connection errors drive the agent's error handling, so replay them too
+            self.turn_events.append({
+                'type': 'http',
+                'method': method,
+                'url': url,
+                'error': describe_error(e),
+                'latency': round(time.perf_counter() - started, 4)
+            })
+            raise
+        self.turn_events.append({
+            'type': 'http',
+            'method': method,
+            'url': url,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type', ''),
+            'body': response.text,
+            'latency': round(time.perf_counter() - started, 4)
+        })
+        return response
+
+    def on_tool(self, name: str, args, kwargs, call):
+        self.turn_events.append({'type': 'tool', 'name': name, 'call': fingerprint([args, kwargs])})
+        return self.run_tool(call)
+
+
+class TurnReplayer(TurnSession):
+    """Runs MemoryAwareAgent offline against a recorded log and reports timing and drift"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.session = None
+        self.turns = []
+        self.load()
+
+    def load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                event = json.loads(line)
+                if event['type'] == 'session':
+                    # A log appended to by several runs replays from its first snapshot
+                    if self.session is None:
+                        self.session = event
+                elif event['type'] == 'turn':
+                    self.turns.append({'input': event['input'], 'events': [], 'end': None})
+                elif event['type'] == 'turn_end':
+                    self.turns[-1]['end'] = event
+                else:
+                    self.turns[-1]['events'].append(event)
+
+        if self.session is None:
+            raise ValueError(f"{self.path} has no session header")
+
+    def start_turn(self, turn: Dict[str, Any]):
+        self.reset_timers()
+        self.llm_queue = deque(e for e in turn['events'] if e['type'] == 'llm')
+        self.http_queue = [e for e in turn['events'] if e['type'] == 'http']
+        self.tool_queue = deque(e for e in turn['events'] if e['type'] == 'tool')
+        self.drift = {'llm_requests': 0, 'tool_calls': 0, 'misses': 0}
+
+    def on_llm(self, role: str, model: str, messages, call):
+        started = time.perf_counter()
+        try:
+            if not self.llm_queue:
+                self.drift['misses'] += 1
+                raise ReplayMissError(f"No recorded LLM response left for {role}")
+            event = self.llm_queue.popleft()
+            if event['role'] != role or event['request'] != fingerprint(messages):
+                self.drift['llm_requests'] += 1
+            return event['response']
+        finally:
+            self.stages['llm'] += time.perf_counter() - started
+
+    def on_http(self, method: str, url: str, call):
+        started = time.perf_counter()
+        try:
+            for index, event in enumerate(self.http_queue):
+                if event['method'] == method and event['url'] == url:
+                    del self.http_queue[index]
+                    if 'error' in event:
+                        raise rebuild_error(event['error'])
+                    response = requests.Response()
+                    response.status_code = event['status']
+                    response.headers['Content-Type'] = event['content_type']
+                    response.encoding = 'utf-8'
+                    response._content = event['body'].encode('utf-8')
+                    response.url = url
+                    return response
+            self.drift['misses'] += 1
+            raise ReplayMissError(f"No recorded response for {method} {url}")
+        finally:
+            self.stages['http'] += time.perf_counter() - started
+
+    def on_tool(self, name: str, args, kwargs, call):
+        expected = self.tool_queue.popleft() if self.tool_queue else None
+        if expected is None or expected['name'] != name or expected['call'] != fingerprint([args, kwargs]):
+            self.drift['tool_calls'] += 1
+        return self.run_tool(call)
+
+    def run(self) -> Dict[str, Any]:
+        """Replay every turn in a scratch copy of the stores and return the report"""
+        from shopping_agent import MemoryAwareAgent
+
+        install_hooks()
+        user_id = self.session['user_id']
+        workdir = tempfile.mkdtemp(prefix='replay_')
+        cwd = os.getcwd()
+        results = []
+        try:
+            # Replays mutate the stores, so they run against the snapshot rather than live data
+            for store_path, content in self.session['snapshot'].items():
+                os.makedirs(os.path.join(workdir, os.path.dirname(store_path)), exist_ok=True)
+                with open(os.path.join(workdir, store_path), 'w') as f:
+                    f.write(content)
+            os.chdir(workdir)
+            os.makedirs('cart_data', exist_ok=True)
+
+            self.start_turn({'events': []})
+            with activate(self):
+                agent = MemoryAwareAgent(user_id)
+            wrap_agent_tools(agent)
+
+            for index, turn in enumerate(self.turns, 1):
+                self.start_turn(turn)
+                started = time.perf_counter()
+                with activate(self):
+                    response = agent.process_conversation(turn['input'])
+                wall_time = time.perf_counter() - started
+
+                recorded = turn['end'] or {}
+                results.append({
+                    'turn': index,
+                    'input': turn['input'],
+                    'wall_time': round(wall_time, 4),
+                    'stages': self.stage_report(wall_time),
+                    'recorded_wall_time': recorded.get('wall_time'),
+                    'recorded_stages': recorded.get('stages'),
+                    'output_drift': response != recorded.get('output'),
+                    'drift': {**self.drift, 'unused_llm': len(self.llm_queue), 'unused_http': len(self.http_queue)}
+                })
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        return {
+            'log': self.path,
+            'user_id': user_id,
+            'turns': len(results),
+            'total_wall_time': round(sum(r['wall_time'] for r in results), 4),
+            'recorded_wall_time': round(sum(r['recorded_wall_time'] or 0 for r in results), 4),
+            'drifted_turns': [r['turn'] for r in results if r['output_drift'] or any(r['drift'].values())],
+            'results': results
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    """Replay one or more recorded logs and print timing and drift"""
+    parser = argparse.ArgumentParser(description="Replay recorded shopping sessions offline")
+    parser.add_argument("logs", nargs="+", help="Recorded *.jsonl.gz session logs")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay each log this many times")
+    args = parser.parse_args(argv)
+
+    for log in args.logs:
+        for _ in range(args.repeat):
+            report = TurnReplayer(log).run()
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()